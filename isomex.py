@@ -24,21 +24,100 @@ Example:
 """
 
 import argparse
+import csv
 import os
+import numpy as np
 import pandas as pd
+import scipy.sparse
 import gzip
+import io
 import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
-def load_data(base_path):
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+    pc = None
+    pacsv = None
+
+# gzip compression level used for the MEX output files
+GZIP_LEVEL = 1
+
+# Columns read from the input files, and the dtypes they are read with
+REQUIRED_COLS = {'id', 'BC', 'count', 'category', 'gene', 'transcript'}
+COLUMN_DTYPES = {'BC': 'category', 'count': 'int32', 'category': 'category',
+                 'gene': 'category', 'transcript': 'category'}
+
+# Values read as missing by pd.read_csv by default; the pyarrow reader is given the same list
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+             '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# pyarrow equivalents of the dtypes used in COLUMN_DTYPES
+ARROW_TYPES = {}
+if pa is not None:
+    ARROW_TYPES = {'category': pa.dictionary(pa.int32(), pa.string()), 'int32': pa.int32()}
+
+def read_tsv(file_path, usecols=None, dtype=None, isoform_categories=None):
+    """
+    Read a tab-delimited file into a DataFrame, keeping only the columns in usecols
+    and reading them with the pandas dtypes in dtype ('category' or 'int32').
+    If isoform_categories is given and the file has a 'category' column, only rows
+    in those categories are kept.
+    Uses the multithreaded pyarrow CSV reader when pyarrow is installed, otherwise pandas.
+    """
+    dtype = dtype or {}
+    if pacsv is None:
+        df = pd.read_csv(file_path, sep='\t', dtype=dtype,
+                         usecols=None if usecols is None else (lambda c: c in usecols))
+        if 'category' in df:
+            df = filter_data(df, isoform_categories)
+        return df
+    
+    include_columns = None
+    if usecols is not None:
+        with open(file_path, encoding='utf-8') as f:
+            header = f.readline().rstrip('\n').split('\t')
+        include_columns = [c for c in header if c in usecols]
+    column_types = {c: ARROW_TYPES[t] for c, t in dtype.items()}
+    # Treat the same values as missing as pandas does, including in string columns
+    convert_options = pacsv.ConvertOptions(include_columns=include_columns,
+                                           column_types=column_types,
+                                           null_values=NA_VALUES, strings_can_be_null=True)
+    table = pacsv.read_csv(file_path, parse_options=pacsv.ParseOptions(delimiter='\t'),
+                           convert_options=convert_options)
+    
+    # Filter on the Arrow table, before any pandas frame is built
+    if isoform_categories and 'category' in table.column_names:
+        table = table.filter(pc.is_in(table['category'], value_set=pa.array(isoform_categories)))
+    df = table.to_pandas()
+    
+    # Arrow dictionaries keep categories in order of appearance; sort them to match pandas
+    for col, col_dtype in df.dtypes.items():
+        if isinstance(col_dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(col_dtype.categories.sort_values())
+    return df
+
+def load_data(base_path, isoform_categories=None):
     """
     Load the two CSV files (assumed to be tab-delimited) and merge on the 'id' column.
+    Only the columns in REQUIRED_COLS are read, and rows are optionally filtered by
+    the 'category' column while reading.
     """
     info_file = base_path + ".info.csv"
     annotated_file = base_path + ".annotated.info.csv"
     
     # Read the txt files - note that they are actually tab delimited, even though they have the ".csv" extension
-    info_df = pd.read_csv(info_file, sep='\t')
-    annotated_df = pd.read_csv(annotated_file, sep='\t')
+    info_df = read_tsv(info_file, usecols=REQUIRED_COLS, dtype=COLUMN_DTYPES,
+                       isoform_categories=isoform_categories)
+    annotated_df = read_tsv(annotated_file, usecols=REQUIRED_COLS, dtype=COLUMN_DTYPES,
+                            isoform_categories=isoform_categories)
+    if isoform_categories and 'category' not in info_df and 'category' not in annotated_df:
+        raise ValueError("Cannot filter on isoform category: no 'category' column in the input files")
     
     # Merge on the "id" column; if both files have overlapping column names (other than id),
     # the ones from the annotated file will be suffixed.
@@ -67,19 +146,77 @@ def load_transcript_map(transcript_map_file):
 
 def filter_data(df, isoform_categories):
     """
-    Optionally filter the merged DataFrame by the 'category' column.
+    Optionally filter a DataFrame by the 'category' column.
     """
     if isoform_categories:
         df = df[df['category'].isin(isoform_categories)]
     return df
 
-def gzip_file(file_path):
-    output_file = file_path + ".gz"
-    with open(file_path, 'rb') as f_in, gzip.open(output_file, 'wb') as f_out:
-        shutil.copyfileobj(f_in, f_out)
-    os.remove(file_path)
+def category_codes(series):
+    """
+    Return the integer codes and sorted categories of a column (-1 for missing values).
+    Non-categorical columns are converted first.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    categories = series.cat.categories
+    if not categories.is_monotonic_increasing:
+        series = series.cat.reorder_categories(categories.sort_values())
+    return series.cat.codes.to_numpy().astype(np.int32), series.cat.categories
 
-def create_mex_matrices(df, group_by, output_prefix, gene_map=None, transcript_map=None):
+def observed_codes(codes, categories):
+    """
+    Drop the categories that do not occur in codes (which must not contain -1)
+    and renumber the codes to match, keeping the categories in sorted order.
+    """
+    used = np.bincount(codes, minlength=len(categories)) > 0
+    if used.all():
+        return codes, categories
+    remap = (np.cumsum(used) - 1).astype(np.int32)
+    return remap[codes], categories[used]
+
+def build_coo(feat_codes, bc_codes, counts, n_features, n_barcodes):
+    """
+    Sum counts per (feature, barcode) pair from integer-coded keys.
+    Returns 1-indexed row and column arrays and the summed counts,
+    ordered by feature then barcode.
+    """
+    # Duplicate (feature, barcode) entries are summed during the CSR conversion
+    matrix = scipy.sparse.coo_matrix(
+        (counts.astype(np.int32), (feat_codes, bc_codes)),
+        shape=(n_features, n_barcodes), dtype=np.int32).tocsr()
+    matrix.sort_indices()
+    
+    rows = np.repeat(np.arange(1, n_features + 1, dtype=np.int32), np.diff(matrix.indptr))
+    cols = matrix.indices + 1
+    return rows, cols, matrix.data
+
+@contextmanager
+def open_gzip_text(file_path):
+    """
+    Open file_path for writing gzipped UTF-8 text.
+    Compresses through pigz (multithreaded gzip) when it is on the PATH, otherwise
+    through the gzip module.
+    """
+    pigz = shutil.which("pigz")
+    if pigz is None:
+        with gzip.open(file_path, 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8') as f:
+            yield f
+        return
+    
+    with open(file_path, 'wb') as out:
+        proc = subprocess.Popen([pigz, f"-{GZIP_LEVEL}", "-p", str(os.cpu_count() or 1)],
+                                stdin=subprocess.PIPE, stdout=out)
+        try:
+            with io.TextIOWrapper(proc.stdin, encoding='utf-8') as f:
+                yield f
+        finally:
+            returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, proc.args)
+
+def create_mex_matrices(df, group_by, output_prefix, gene_map=None, transcript_map=None,
+                        bc_codes=None, barcodes=None):
     """
     Create a MEX-format output given:
       - df: the merged pandas DataFrame
@@ -87,13 +224,16 @@ def create_mex_matrices(df, group_by, output_prefix, gene_map=None, transcript_m
       - output_prefix: output directory where files will be saved
       - gene_map: dictionary mapping gene names to (gene_id, gene_name); used if group_by=="gene".
       - transcript_map: dictionary mapping transcript names to (transcript_id, transcript_name); used if group_by=="transcript".
+      - bc_codes, barcodes: optional precomputed barcode codes and sorted barcodes, as returned by
+        category_codes(df['BC']); if given, df does not need a 'BC' column. Only the barcodes
+        that occur with a non-missing feature are written for each matrix.
     
     The function automatically sets:
       - feature_type_label = "Gene Expression" if group_by=="gene", or
       - feature_type_label = "Transcript Expression" if group_by=="transcript".
     
-    The function groups by the feature and barcode ('BC'), sums the 'count', and writes three files:
-      matrix.mtx, features.tsv, and barcodes.tsv.
+    The function sums the 'count' per feature and barcode ('BC') and writes three gzipped files:
+      matrix.mtx.gz, features.tsv.gz, and barcodes.tsv.gz.
     """
 
     # Set feature_type_label and mapping dictionary automatically.
@@ -110,61 +250,53 @@ def create_mex_matrices(df, group_by, output_prefix, gene_map=None, transcript_m
         mapping = None
         outdir = str(group_by) + "_" + str(output_prefix)
 
-    # Group by the feature (gene or transcript) and the cell barcode (BC)
-    grouped = df.groupby([group_by, 'BC'])['count'].sum().reset_index()
-    
-    # Get sorted lists of unique features and barcodes for reproducible output order
-    features = sorted(grouped[group_by].unique())
-    barcodes = sorted(grouped['BC'].unique())
+    # Use sorted integer codes for features and barcodes for reproducible output order
+    feat_codes, features = category_codes(df[group_by])
+    if bc_codes is None:
+        bc_codes, barcodes = category_codes(df['BC'])
     
-    # Create mappings (we will write the matrix in 1-indexed format per MEX convention)
-    feature_to_index = {feat: i for i, feat in enumerate(features)}
-    barcode_to_index = {bc: i for i, bc in enumerate(barcodes)}
+    # As with a groupby, rows with a missing feature or barcode are not counted, and
+    # features or barcodes that only occur in such rows are left out of the output.
+    keep = (feat_codes >= 0) & (bc_codes >= 0)
+    feat_codes, features = observed_codes(feat_codes[keep], features)
+    bc_codes, barcodes = observed_codes(bc_codes[keep], barcodes)
     
-    # Build coordinate lists for the matrix (using 1-indexing)
-    rows, cols, data = [], [], []
-    for _, row in grouped.iterrows():
-        feat = row[group_by]
-        bc = row['BC']
-        cnt = row['count']
-        rows.append(feature_to_index[feat] + 1)
-        cols.append(barcode_to_index[bc] + 1)
-        data.append(cnt)
+    rows, cols, data = build_coo(feat_codes, bc_codes, df['count'].to_numpy()[keep],
+                                 len(features), len(barcodes))
     
     # Ensure output directory exists
     os.makedirs(outdir, exist_ok=True)
-    mm_file = os.path.join(outdir, "matrix.mtx")
-    features_file = os.path.join(outdir, "features.tsv")
-    barcodes_file = os.path.join(outdir, "barcodes.tsv")
+    mm_file = os.path.join(outdir, "matrix.mtx.gz")
+    features_file = os.path.join(outdir, "features.tsv.gz")
+    barcodes_file = os.path.join(outdir, "barcodes.tsv.gz")
     
-    # Write matrix.mtx using pandas for the numeric portion and manual header insertion.
-    matrix_df = pd.DataFrame({'row': rows, 'col': cols, 'data': data})
-    with open(mm_file, 'w') as f:
+    # Write matrix.mtx.gz: header lines followed by the coordinate triples in a single pass.
+    # The files are gzipped as they are written; a low compression level keeps this fast
+    # with little loss in size for the integer-only MEX data. The matrix is by far the
+    # largest file, so it is compressed with pigz when available.
+    with open_gzip_text(mm_file) as f:
         f.write("%%MatrixMarket matrix coordinate integer general\n")
         f.write("%\n")
         f.write(f"{len(features)} {len(barcodes)} {len(data)}\n")
-    matrix_df.to_csv(mm_file, sep=' ', mode='a', header=False, index=False)
-    
-    # Write features.tsv: each line has feature_id, feature_name, and feature type label.
-    features_list = []
-    for feat in features:
-        if mapping and (feat in mapping):
-            feat_id, feat_name = mapping[feat]
-        else:
-            feat_id, feat_name = feat, feat
-        features_list.append([feat_id, feat_name, feature_type_label])
-    features_df = pd.DataFrame(features_list)
-    features_df.to_csv(features_file, sep='\t', header=False, index=False)
-    
-    # Write barcodes.tsv: one barcode per line.
-    barcodes_modified = [str(bc) + "-1" for bc in barcodes]
-    barcodes_df = pd.DataFrame(barcodes_modified)
-    barcodes_df.to_csv(barcodes_file, sep='\t', header=False, index=False)
-    
-    # Gzip the three files
-    gzip_file(mm_file)
-    gzip_file(features_file)
-    gzip_file(barcodes_file)
+        pd.DataFrame({'row': rows, 'col': cols, 'data': data}).to_csv(
+            f, sep=' ', header=False, index=False)
+    
+    # Write features.tsv.gz: each line has feature_id, feature_name, and feature type label.
+    with gzip.open(features_file, 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8',
+                   newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        for feat in features:
+            if mapping and (feat in mapping):
+                feat_id, feat_name = mapping[feat]
+            else:
+                feat_id, feat_name = feat, feat
+            writer.writerow([feat_id, feat_name, feature_type_label])
+    
+    # Write barcodes.tsv.gz: one barcode per line.
+    barcodes_modified = np.char.add(np.asarray(barcodes, dtype=str), "-1")
+    with gzip.open(barcodes_file, 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8') as f:
+        if len(barcodes_modified):
+            f.write("\n".join(barcodes_modified) + "\n")
 
     print(f"{group_by} output written to directory: {outdir}")
 
@@ -187,9 +319,16 @@ def main():
     if args.filter_category:
         filter_categories = [cat.strip() for cat in args.filter_category.split(",")]
     
-    # Load and merge input files.
-    df = load_data(args.base)
-    df = filter_data(df, filter_categories)
+    # Load, filter and merge input files.
+    df = load_data(args.base, filter_categories)
+    
+    # Keep only the columns used to build the matrices, storing the key columns as
+    # categoricals with sorted categories so they are grouped by integer codes;
+    # categories removed by the filter are dropped. Counts are held as int32.
+    df = df[['gene', 'transcript', 'BC', 'count']]
+    df = df.assign(count=df['count'].astype(np.int32),
+                   **{col: df[col].astype('category').cat.remove_unused_categories()
+                      for col in ('gene', 'transcript', 'BC')})
     
     gene_map = None
     transcript_map = None
@@ -198,13 +337,20 @@ def main():
     if args.transcript_map:
         transcript_map = load_transcript_map(args.transcript_map)
     
-    # Create gene-level MEX matrix.
-    create_mex_matrices(df, group_by="gene", output_prefix=args.output_dir,
-                        gene_map=gene_map, transcript_map=transcript_map)
+    # The barcode codes are computed once here and shared by both matrices; each matrix
+    # still keeps only the barcodes that occur with one of its features.
+    bc_codes, barcodes = category_codes(df['BC'])
     
-    # Create transcript-level MEX matrix.
-    create_mex_matrices(df, group_by="transcript", output_prefix=args.output_dir,
-                        gene_map=gene_map, transcript_map=transcript_map)
+    # Create the gene-level and transcript-level MEX matrices concurrently.
+    # Each worker only receives the feature and count columns it needs.
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(create_mex_matrices, df[[group_by, 'count']], group_by=group_by,
+                                   output_prefix=args.output_dir,
+                                   gene_map=gene_map, transcript_map=transcript_map,
+                                   bc_codes=bc_codes, barcodes=barcodes)
+                   for group_by in ("gene", "transcript")]
+        for future in futures:
+            future.result()
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
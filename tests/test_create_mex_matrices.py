@@ -0,0 +1,87 @@
+import gzip
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import isomex
+
+
+def read_gz(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("shared_barcodes", [False, True])
+def test_missing_keys_are_left_out(tmp_path, monkeypatch, shared_barcodes):
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame({
+        "gene": ["G1", "G1", "G2", np.nan, "G3", "G2"],
+        "BC": ["B1", "B1", "B2", "B3", np.nan, "B1"],
+        "count": [1, 2, 4, 5, 6, 1],
+    }).astype({"gene": "category", "BC": "category", "count": np.int32})
+    gene_map = {"G1": ("ENSG1", "G1")}
+
+    if shared_barcodes:
+        bc_codes, barcodes = isomex.category_codes(df["BC"])
+        isomex.create_mex_matrices(df[["gene", "count"]], "gene", "out", gene_map=gene_map,
+                                   bc_codes=bc_codes, barcodes=barcodes)
+    else:
+        isomex.create_mex_matrices(df, "gene", "out", gene_map=gene_map)
+
+    # B3 only occurs with a missing gene and G3 only with a missing barcode
+    assert read_gz("gene_out/matrix.mtx.gz") == (
+        "%%MatrixMarket matrix coordinate integer general\n"
+        "%\n"
+        "2 2 3\n"
+        "1 1 3\n"
+        "2 1 1\n"
+        "2 2 4\n"
+    )
+    assert read_gz("gene_out/features.tsv.gz") == (
+        "ENSG1\tG1\tGene Expression\n"
+        "G2\tG2\tGene Expression\n"
+    )
+    assert read_gz("gene_out/barcodes.tsv.gz") == "B1-1\nB2-1\n"
+
+
+def test_shared_barcodes_are_reduced_per_matrix(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame({
+        "gene": ["G1", "G1", "G2"],
+        "transcript": ["T1", np.nan, "T2"],
+        "BC": ["B1", "B9", "B2"],
+        "count": [1, 2, 3],
+    }).astype({"gene": "category", "transcript": "category", "BC": "category",
+               "count": np.int32})
+
+    bc_codes, barcodes = isomex.category_codes(df["BC"])
+    for group_by in ("gene", "transcript"):
+        isomex.create_mex_matrices(df[[group_by, "count"]], group_by, "out",
+                                   bc_codes=bc_codes, barcodes=barcodes)
+
+    # B9 only occurs with a missing transcript
+    assert read_gz("gene_out/barcodes.tsv.gz") == "B1-1\nB2-1\nB9-1\n"
+    assert read_gz("gene_out/matrix.mtx.gz") == (
+        "%%MatrixMarket matrix coordinate integer general\n"
+        "%\n"
+        "2 3 3\n"
+        "1 1 1\n"
+        "1 3 2\n"
+        "2 2 3\n"
+    )
+    assert read_gz("transcript_out/barcodes.tsv.gz") == "B1-1\nB2-1\n"
+    assert read_gz("transcript_out/matrix.mtx.gz") == (
+        "%%MatrixMarket matrix coordinate integer general\n"
+        "%\n"
+        "2 2 2\n"
+        "1 1 1\n"
+        "2 2 3\n"
+    )
+    assert read_gz("transcript_out/features.tsv.gz") == (
+        "T1\tT1\tTranscript Expression\n"
+        "T2\tT2\tTranscript Expression\n"
+    )
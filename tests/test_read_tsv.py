@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import isomex
+
+pytest.importorskip("pyarrow")
+
+
+def test_pyarrow_and_pandas_readers_agree_on_missing_values(tmp_path, monkeypatch):
+    path = tmp_path / "sample.info.csv"
+    path.write_text(
+        "id\tBC\tcount\tgene\tcategory\n"
+        "m1\tAAAC\t1\tG1\tfull-splice_match\n"
+        "m2\tNA\t2\tG2\tfull-splice_match\n"
+        "m3\t\t3\tG1\tantisense\n"
+        "m4\tAAAG\t4\t\tantisense\n"
+        "m5\tAAAG\t5\tNA\tN/A\n"
+    )
+
+    arrow_df = isomex.read_tsv(path, usecols=isomex.REQUIRED_COLS, dtype=isomex.COLUMN_DTYPES)
+    monkeypatch.setattr(isomex, "pacsv", None)
+    pandas_df = isomex.read_tsv(path, usecols=isomex.REQUIRED_COLS, dtype=isomex.COLUMN_DTYPES)
+
+    pd.testing.assert_frame_equal(arrow_df, pandas_df)
+    assert arrow_df["BC"].isna().tolist() == [False, True, True, False, False]
+    assert arrow_df["gene"].isna().tolist() == [False, False, False, True, True]
@@ -1,8 +1,30 @@
 #!/usr/bin/env python3
 
 import argparse
-import gffutils
-import pandas as pd
+import csv
+import gzip
+import re
+
+# Matches the gene/transcript ID and name attributes in the GTF attribute column;
+# the leading \b keeps keys such as ref_gene_id from matching as gene_id
+ATTRIBUTE_PATTERN = re.compile(r'\b(gene_id|gene_name|transcript_id|transcript_name) "([^"]+)"')
+
+def open_gtf(gtf_file):
+    """
+    Open a GTF file for reading as UTF-8 text, decompressing it if it ends in ".gz".
+    """
+    if gtf_file.endswith(".gz"):
+        return gzip.open(gtf_file, "rt", encoding="utf-8")
+    return open(gtf_file, encoding="utf-8")
+
+def write_map(map_out, header, mapping):
+    """
+    Write a mapping dictionary as a tab-delimited UTF-8 file with a header line.
+    """
+    with open(map_out, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(mapping.items())
 
 def generate_mappings(gtf_file, gene_map_out, transcript_map_out):
     """
@@ -11,28 +33,34 @@ def generate_mappings(gtf_file, gene_map_out, transcript_map_out):
     - A transcript mapping file (transcript_id → transcript_name)
     """
 
-    # Create an in-memory database from the GTF file
-    db = gffutils.create_db(gtf_file, dbfn=":memory:", force=True, keep_order=True,
-                            merge_strategy="merge", sort_attribute_values=True)
-
-    # Generate gene map dataframe
-    gene_map = []
-    for gene in db.features_of_type("gene"):
-        gene_id = gene.attributes.get("gene_id", [""])[0]
-        gene_name = gene.attributes.get("gene_name", [gene_id])[0]
-        gene_map.append({"gene_id": gene_id, "gene_name": gene_name})
-    gene_df = pd.DataFrame(gene_map)
-    gene_df.to_csv("gene_map.txt", sep="\t", index=False)
+    # Collect IDs and names from every feature line, so genes and transcripts that only
+    # appear through their exons are included. IDs without a name map to themselves.
+    gene_map = {}
+    transcript_map = {}
+    with open_gtf(gtf_file) as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 9:
+                continue
+            # Keep the first value of each attribute, as gffutils did
+            attributes = {}
+            for key, value in ATTRIBUTE_PATTERN.findall(parts[8]):
+                attributes.setdefault(key, value)
+
+            gene_id = attributes.get("gene_id")
+            if gene_id and gene_map.get(gene_id, gene_id) == gene_id:
+                gene_map[gene_id] = attributes.get("gene_name", gene_id)
+
+            transcript_id = attributes.get("transcript_id")
+            if transcript_id and transcript_map.get(transcript_id, transcript_id) == transcript_id:
+                transcript_map[transcript_id] = attributes.get("transcript_name", transcript_id)
+
+    write_map(gene_map_out, ["gene_id", "gene_name"], gene_map)
     print(f"Gene map saved to {gene_map_out}")
 
-    # Generate transcript map dataframe
-    transcript_map = []
-    for transcript in db.features_of_type("transcript"):
-        transcript_id = transcript.attributes.get("transcript_id", [""])[0]
-        transcript_name = transcript.attributes.get("transcript_name", [transcript_id])[0]
-        transcript_map.append({"transcript_id": transcript_id, "transcript_name": transcript_name})
-    transcript_df = pd.DataFrame(transcript_map)
-    transcript_df.to_csv("transcript_map.txt", sep="\t", index=False)
+    write_map(transcript_map_out, ["transcript_id", "transcript_name"], transcript_map)
     print(f"Transcript map saved to {transcript_map_out}")
 
 if __name__ == "__main__":
@@ -40,6 +68,6 @@ if __name__ == "__main__":
     parser.add_argument("gtf_file", help="Input GTF annotation file")
     parser.add_argument("gene_map_out", help="Output file for gene mappings")
     parser.add_argument("transcript_map_out", help="Output file for transcript mappings")
-    
+
     args = parser.parse_args()
-    generate_mappings(args.gtf_file, args.gene_map_out, args.transcript_map_out)
\ No newline at end of file
+    generate_mappings(args.gtf_file, args.gene_map_out, args.transcript_map_out)